@@ -2,41 +2,43 @@
 import pandas as pd
 import numpy as np
 import os
-import re
+from concurrent.futures import ThreadPoolExecutor
+
+# 'string' dtype is Arrow-backed, so .str methods run on Arrow compute kernels
+pd.options.mode.string_storage = 'pyarrow'
 
 # Config
-INPUT_DIR = 'cleaned_csv'
-INPUT_FILE = 'last_few_months_total_lead_data_filtered_clean.csv' # Default input from pipeline
+INPUT_DIR = 'cleaned_parquet'
+INPUT_FILE = 'last_few_months_total_lead_data_filtered_clean.parquet' # Default input from pipeline
 OUTPUT_DIR = 'enriched_csv'
 OUTPUT_FILE = 'last_few_months_total_lead_data_enriched.csv'
 
-def is_google_maps_url(url):
-    """Check if the URL looks like a Google Maps link"""
-    if pd.isna(url) or str(url).strip() == '':
-        return False
-    url_lower = str(url).lower()
-    maps_indicators = ['maps.google', 'goo.gl/maps', 'google.com/maps', 'maps.app.goo.gl']
-    return any(ind in url_lower for ind in maps_indicators)
-def is_social_media_url(url):
-    """Check if the URL looks like a Social Media link"""
-    if pd.isna(url) or str(url).strip() == '':
-        return False
-    url_lower = str(url).lower()
-    social_domains = [
-        'instagram.com', 'snapchat.com', 'youtube.com', 'facebook.com', 
-        'twitter.com', 'x.com', 'linkedin.com', 'tiktok.com', 'pinterest.com'
-    ]
-    return any(domain in url_lower for domain in social_domains)
-
-def is_ecommerce_url(url):
-    """Check if the URL looks like an E-commerce link (e.g. Salla)"""
-    if pd.isna(url) or str(url).strip() == '':
-        return False
-    url_lower = str(url).lower()
-    ecommerce_domains = [
-        'salla.sa'
-    ]
-    return any(domain in url_lower for domain in ecommerce_domains)
+# URL classifier patterns (alternations scanned in one pass by Series.str.contains)
+MAPS_PATTERN = r'maps\.google|goo\.gl/maps|google\.com/maps|maps\.app\.goo\.gl'
+SOCIAL_PATTERN = (
+    r'instagram\.com|snapchat\.com|youtube\.com|facebook\.com|'
+    r'twitter\.com|x\.com|linkedin\.com|tiktok\.com|pinterest\.com'
+)
+ECOMMERCE_PATTERN = r'salla\.sa'
+
+def is_blank(series):
+    """Vectorized emptiness check: NaN, blank after strip, or the literal 'nan'"""
+    s = series.astype('string')
+    return s.isna() | (s.str.strip() == '') | (s.str.lower() == 'nan')
+
+def classify_urls(series):
+    """
+    Return (maps, social, ecommerce) masks for a URL column; maps takes priority.
+    The three case-insensitive scans run on Arrow regex kernels, which release
+    the GIL, so they are spread over a thread pool instead of run back to back.
+    """
+    site = series.astype('string')
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        maps_mask, social_mask, ecom_mask = pool.map(
+            lambda pattern: site.str.contains(pattern, case=False, regex=True, na=False),
+            [MAPS_PATTERN, SOCIAL_PATTERN, ECOMMERCE_PATTERN]
+        )
+    return maps_mask, social_mask & ~maps_mask, ecom_mask & ~maps_mask
 
 def main():
     input_path = os.path.join(INPUT_DIR, INPUT_FILE)
@@ -44,7 +46,9 @@ def main():
     
     print(f"📂 Loading data from: {input_path}")
     try:
-        df = pd.read_csv(input_path, low_memory=False)
+        df = pd.read_parquet(input_path, engine='pyarrow')
+        obj_cols = df.select_dtypes(include='object').columns
+        df[obj_cols] = df[obj_cols].astype('string[pyarrow]')
         print(f"   ✅ Queries Loaded: {len(df):,} records")
     except FileNotFoundError:
         print(f"   ❌ File not found: {input_path}")
@@ -55,12 +59,6 @@ def main():
     
     print("\n🔍 perform enrichment on website, map & social columns...")
     
-    # Counter for stats
-    moved_maps = 0
-    removed_maps = 0
-    moved_social = 0
-    moved_ecommerce = 0
-    
     # Working columns
     website_col = 'website'
     map_col = 'google_map_id'
@@ -77,63 +75,33 @@ def main():
     if ecommerce_col not in df.columns:
         df[ecommerce_col] = np.nan
 
-    # Iteration
-    for idx, row in df.iterrows():
-        site = row[website_col]
-        
-        # safely get current values as strings for checking emptiness usually
-        # But here we rely on the helper functions' NaN checks
-        
-        # 1. Check for Google Maps in Website
-        if is_google_maps_url(site):
-            current_map = row[map_col]
-            # Check if map column is truly empty (NaN or empty string or 'nan' string)
-            is_map_empty = pd.isna(current_map) or str(current_map).strip() == '' or str(current_map).lower() == 'nan'
-            
-            if is_map_empty:
-                df.at[idx, map_col] = site
-                moved_maps += 1
-            
-            # Remove from website (Moved or Redundant)
-            df.at[idx, website_col] = np.nan
-            removed_maps += 1
-            continue # Done with this website value
-            
-        # 2. Check for Social Media in Website
-        if is_social_media_url(site):
-            current_social = row[social_col]
-            is_social_empty = pd.isna(current_social) or str(current_social).strip() == '' or str(current_social).lower() == 'nan'
-            
-            if is_social_empty:
-                df.at[idx, social_col] = site
-            else:
-                # Append if social links already exist? Or overwrite? 
-                # "move... into this column" - usually implies appending if something exists, 
-                # but to avoid duplicates let's just append with space or specific delimiter if needed.
-                # User didn't specify delimiter, but ' ' is safe or '|'
-                # Let's assume we overwrite or append. Let's append for completeness.
-                df.at[idx, social_col] = str(current_social) + ' | ' + str(site)
-            
-            # Remove from website
-            df.at[idx, website_col] = np.nan
-            moved_social += 1
-
-            # moved_maps = moved_maps # no change
-
-        # 3. Check for E-commerce in Website
-        if is_ecommerce_url(site):
-            current_ecom = row[ecommerce_col]
-            is_ecom_empty = pd.isna(current_ecom) or str(current_ecom).strip() == '' or str(current_ecom).lower() == 'nan'
-            
-            if is_ecom_empty:
-                df.at[idx, ecommerce_col] = site
-            else:
-                # Append if exists
-                df.at[idx, ecommerce_col] = str(current_ecom) + ' | ' + str(site)
-            
-            # Remove from website
-            df.at[idx, website_col] = np.nan
-            moved_ecommerce += 1
+    # Classify website values (maps takes priority over social / e-commerce)
+    maps_mask, social_mask, ecom_mask = classify_urls(df[website_col])
+
+    # 1. Google Maps: fill map column only if empty, otherwise the website value is redundant
+    fill_map = maps_mask & is_blank(df[map_col])
+    df[map_col] = df[map_col].mask(fill_map, df[website_col])
+    moved_maps = fill_map.sum()
+    removed_maps = maps_mask.sum()
+
+    # 2. Social Media: set if empty, append with ' | ' if links already exist
+    social_value = df[website_col].where(
+        is_blank(df[social_col]),
+        df[social_col].astype('string') + ' | ' + df[website_col].astype('string')
+    )
+    df[social_col] = df[social_col].mask(social_mask, social_value)
+    moved_social = social_mask.sum()
+
+    # 3. E-commerce: same set-or-append rule
+    ecom_value = df[website_col].where(
+        is_blank(df[ecommerce_col]),
+        df[ecommerce_col].astype('string') + ' | ' + df[website_col].astype('string')
+    )
+    df[ecommerce_col] = df[ecommerce_col].mask(ecom_mask, ecom_value)
+    moved_ecommerce = ecom_mask.sum()
+
+    # Remove moved / redundant links from website
+    df.loc[maps_mask | social_mask | ecom_mask, website_col] = np.nan
 
     print(f"   ✅ Google Maps: Moved {moved_maps} links to {map_col}")
     print(f"   ✅ Google Maps: Removed {removed_maps} links from {website_col}")
@@ -143,94 +111,67 @@ def main():
     # Add Flags
     print("\n🔍 Adding Enrichment Flags...")
     
-    # helper for flag creation
-    def create_flag(series):
-        return series.notna().astype(int) & (series.astype(str).str.strip() != '') & (series.astype(str).str.lower() != 'nan')
+    # Normalize blanks / literal 'nan' to NaN once so flags are plain notna() checks
+    for col in [website_col, map_col, social_col, ecommerce_col]:
+        df[col] = df[col].mask(is_blank(df[col]))
 
     # 1. is_converted
     if 'converted_date' in df.columns:
-        df['is_converted'] = df['converted_date'].notna().astype(int)
+        df['is_converted'] = df['converted_date'].notna().astype('int8')
     else:
-        df['is_converted'] = 0
+        df['is_converted'] = np.zeros(len(df), dtype='int8')
         
     # 2. has_website (Cleaned)
-    df['has_website'] = create_flag(df[website_col]).astype(int)
+    df['has_website'] = df[website_col].notna().astype('int8')
     
     # 3. has_maps
-    df['has_maps'] = create_flag(df[map_col]).astype(int)
+    df['has_maps'] = df[map_col].notna().astype('int8')
     
     # 4. has_social_media
-
-    df['has_social_media'] = create_flag(df[social_col]).astype(int)
+    df['has_social_media'] = df[social_col].notna().astype('int8')
 
     # 5. has_ecommerce
-    df['has_ecommerce'] = create_flag(df[ecommerce_col]).astype(int)
+    df['has_ecommerce'] = df[ecommerce_col].notna().astype('int8')
     
     # ---------------------------------------------------------
     # Journey / Status Tracking
     # ---------------------------------------------------------
     print("\n🛤️  Tracking Lead Journey...")
     
-    # helper to parse date columns
-    date_cols = ['created_date', 'kyb_in_progress_date', 'kyb_submitted_date', 'last_status_change_date', 'converted_date']
-    for col in date_cols:
-        if col in df.columns:
-            df[col] = pd.to_datetime(df[col], errors='coerce')
+    # Date columns arrive as datetime64 from the pipeline's Parquet output
     
     # Clean Onboarding Step Naming
-    def clean_step_name(val):
-        if pd.isna(val) or val == '':
-            return np.nan
-        # Remove versions like v2_, v3_
-        val = str(val).lower()
-        val = re.sub(r'v\d+_', '', val)
-        val = val.replace('_step', '').replace('_', ' ').title()
-        return val
-
-    def extract_version(val):
-        if pd.isna(val) or val == '':
-            return 'Unknown'
-        val_str = str(val).lower()
-        match = re.search(r'(v\d+)', val_str)
-        if match:
-            return match.group(1).upper() # e.g. V2, V3
-        return 'Unknown' # Or None/NaN if preferred, but Unknown is explicit
-
     if 'onboarding_step' in df.columns:
-        df['readable_onboarding_step'] = df['onboarding_step'].apply(clean_step_name)
-        df['onboarding_version'] = df['onboarding_step'].apply(extract_version)
+        raw_step = df['onboarding_step'].astype('string').str.lower().mask(lambda s: s == '')
+        # Remove versions like v2_, v3_
+        df['readable_onboarding_step'] = (
+            raw_step.str.replace(r'v\d+_', '', regex=True)
+                    .str.replace('_step', '', regex=False)
+                    .str.replace('_', ' ', regex=False)
+                    .str.title()
+        )
+        # e.g. V2, V3; Unknown is explicit for missing / unversioned steps
+        df['onboarding_version'] = raw_step.str.extract(r'(v\d+)', expand=False).str.upper().fillna('Unknown').astype('category')
     else:
         df['readable_onboarding_step'] = np.nan
         df['onboarding_version'] = np.nan
 
-    # Determine Current Journey Stage
-    def get_journey_stage(row):
-        # 1. Converted (Highest Priority)
-        if 'converted_date' in row and pd.notna(row['converted_date']):
-            return 'Converted'
-        
-        # 2. KYB Submitted
-        if 'kyb_submitted_date' in row and pd.notna(row['kyb_submitted_date']):
-            return 'KYB Submitted'
-            
-        # 3. KYB In Progress
-        if 'kyb_in_progress_date' in row and pd.notna(row['kyb_in_progress_date']):
-            return 'KYB In Progress'
-        
-        # 4. Onboarding Steps (Granular Status)
-        step = row.get('readable_onboarding_step')
-        if pd.notna(step):
-            if 'Final' in str(step):
-                return 'Onboarding Completed' # Ready for KYB likely
-            return f"Onboarding: {step}"
-            
-        # 5. Registered / Created
-        if 'created_date' in row and pd.notna(row['created_date']):
-            return 'Registered'
-            
-        return 'Unknown'
-
-    df['journey_stage'] = df.apply(get_journey_stage, axis=1)
+    # Determine Current Journey Stage (first matching condition wins)
+    missing = pd.Series(pd.NaT, index=df.index)
+    step = df['readable_onboarding_step']
+    onboarding_stage = ('Onboarding: ' + step.astype('string')).mask(
+        step.astype('string').str.contains('Final', na=False), 'Onboarding Completed' # Ready for KYB likely
+    )
+    conds = [
+        df.get('converted_date', missing).notna(),        # 1. Converted (Highest Priority)
+        df.get('kyb_submitted_date', missing).notna(),    # 2. KYB Submitted
+        df.get('kyb_in_progress_date', missing).notna(),  # 3. KYB In Progress
+        step.notna(),                                     # 4. Onboarding Steps (Granular Status)
+        df.get('created_date', missing).notna(),          # 5. Registered / Created
+    ]
+    choices = ['Converted', 'KYB Submitted', 'KYB In Progress', onboarding_stage, 'Registered']
+    # Only a handful of distinct stages: category keeps one code per row and speeds value_counts
+    df['journey_stage'] = pd.Categorical(np.select(conds, choices, default='Unknown'))
 
     # ---------------------------------------------------------
     # Onboarding Phases (Binary Flags)
@@ -255,13 +196,10 @@ def main():
         'final_step': ['v2_final_step', 'v3_final_step'] # v2_final_step / v3_final_step
     }
 
-    def check_step(val, valid_steps):
-        if pd.isna(val):
-            return 0
-        return 1 if str(val).strip() in valid_steps else 0
-
+    # Strip once, then one hash lookup per flag column
+    stripped_step = df['onboarding_step'].astype('string').str.strip()
     for col_name, steps in step_config.items():
-        df[col_name] = df['onboarding_step'].apply(lambda x: check_step(x, steps))
+        df[col_name] = stripped_step.isin(steps).astype('int8')
         print(f"   ✅ Added '{col_name}' (Count: {df[col_name].sum()})")
 
     # ---------------------------------------------------------
@@ -281,16 +219,17 @@ def main():
         # But this drops multiple NaNs. 
         # Strategy: distinct drop on non-null values.
         
-        mask = df.duplicated(subset=['mobile'], keep='first') & df['mobile'].notna()
-        dupes_mobile_count = mask.sum()
-        df = df[~mask]
+        # Single hash pass on the column; the notna() guard keeps every missing mobile.
+        dupes = df['mobile'].notna() & df['mobile'].duplicated(keep='first')
+        dupes_mobile_count = dupes.sum()
+        df = df.drop(index=df.index[dupes])
         print(f"   ✅ Dropped {dupes_mobile_count} duplicate mobile numbers.")
 
     # 2. Drop Email Duplicates
     if 'email' in df.columns:
-        mask = df.duplicated(subset=['email'], keep='first') & df['email'].notna()
-        dupes_email_count = mask.sum()
-        df = df[~mask]
+        dupes = df['email'].notna() & df['email'].duplicated(keep='first')
+        dupes_email_count = dupes.sum()
+        df = df.drop(index=df.index[dupes])
         print(f"   ✅ Dropped {dupes_email_count} duplicate emails.")
 
     final_count = len(df)
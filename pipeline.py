@@ -4,16 +4,26 @@
 
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
 import os
+import csv
 from datetime import datetime
 
+# 'string' dtype is Arrow-backed, so .str methods run on Arrow compute kernels
+pd.options.mode.string_storage = 'pyarrow'
+
 # ============================================================================
 # CONFIGURATION
 # ============================================================================
 
 RAW_CSV_PATH = 'raw_csv/last few months total lead data.csv'
-CLEANED_CSV_PATH = 'cleaned_csv/last_few_months_total_lead_data_filtered_clean.csv'
+CLEANED_PARQUET_PATH = 'cleaned_parquet/last_few_months_total_lead_data_filtered_clean.parquet'
 BLACKLIST_START_DATE = pd.Timestamp('2024-06-01')
+DATE_FORMAT = 'ISO8601' # Fast C path; values in other layouts fall back to format='mixed' (see clean_dates)
+CSV_BLOCK_SIZE = 64 << 20 # Bytes of raw CSV per streamed batch (bounds peak memory)
 
 print("="*70)
 print("TAMARA LEAD DATA PIPELINE - FILTERED & CLEANED")
@@ -132,10 +142,77 @@ SELECTED_COLUMNS = [
     'utm_campaign'
 ]
 
+# Low-cardinality columns stored as pandas 'category' in the output
+CATEGORY_COLUMNS = ['business_type', 'lead_status', 'contacted_status']
+
 # ============================================================================
 # PROCESSING FUNCTIONS
 # ============================================================================
 
+def open_csv_arrow(path, columns=None):
+    """
+    Open a streaming PyArrow CSV reader that yields record batches of ~CSV_BLOCK_SIZE bytes.
+    If `columns` is given, only those present in the header are parsed.
+    Every column is read as text so types cannot drift between batches (dates: see clean_dates).
+    """
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        header = next(csv.reader(f), [])
+    include = header if columns is None else [c for c in header if c in set(columns)]
+
+    return pacsv.open_csv(
+        path,
+        read_options=pacsv.ReadOptions(block_size=CSV_BLOCK_SIZE, use_threads=True),
+        # Quoted free-text cells (e.g. business activities) may span lines
+        parse_options=pacsv.ParseOptions(delimiter=',', newlines_in_values=True),
+        convert_options=pacsv.ConvertOptions(
+            include_columns=include,
+            column_types={c: pa.string() for c in include},
+            strings_can_be_null=True,
+        ),
+    )
+
+def arrow_to_pandas(tbl):
+    """Convert an Arrow table to pandas with text columns as string[pyarrow]"""
+    return tbl.to_pandas(types_mapper={pa.string(): pd.StringDtype('pyarrow')}.get)
+
+def prefilter_blacklist(tbl):
+    """
+    Drop rows that apply_blacklist_logic will certainly reject, on the raw Arrow
+    table before any pandas columns are built: created on/after the cutoff and
+    not passed. Rows whose created date is missing or not ISO formatted are kept
+    and left for the pandas-side logic to decide.
+    """
+    source = {target: src for src, target in COLUMN_MAPPING.items()}
+    created_src, blacklist_src = source['created_date'], source['blacklist_raw']
+    if created_src not in tbl.column_names or blacklist_src not in tbl.column_names:
+        return tbl
+
+    # Cutoff is a calendar date, so the 'YYYY-MM-DD' prefix is enough to compare
+    created = pc.strptime(
+        pc.utf8_slice_codeunits(tbl[created_src], 0, 10), format='%Y-%m-%d', unit='s', error_is_null=True
+    )
+    cutoff = pa.scalar(BLACKLIST_START_DATE.to_pydatetime(), type=pa.timestamp('s'))
+
+    raw = tbl[blacklist_src]
+    passed = pc.fill_null(pc.or_kleene(pc.match_substring(raw, 'green.png'), pc.equal(raw, '1')), False)
+    rejected = pc.and_kleene(pc.greater_equal(created, cutoff), pc.invert(passed))
+    return tbl.filter(pc.invert(pc.fill_null(rejected, False)))
+
+def output_schema(df):
+    """
+    Parquet schema for the streamed output. Types that depend on batch content
+    are fixed here, since the first batch may keep no rows (or only nulls):
+    categories as string dictionaries with indices wide enough for any batch,
+    dates as timestamp[ns], the sales tier as int8.
+    """
+    fixed = {col: pa.dictionary(pa.int32(), pa.string()) for col in CATEGORY_COLUMNS}
+    fixed['reported_annual_sales_tier'] = pa.int8()
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    return pa.schema([
+        field.with_type(fixed.get(field.name, pa.timestamp('ns') if pa.types.is_timestamp(field.type) else field.type))
+        for field in schema
+    ], metadata=schema.metadata)
+
 def clean_dates(df):
     """Parse date columns standardizing formats"""
     date_cols = [
@@ -146,7 +223,17 @@ def clean_dates(df):
     
     for col in date_cols:
         if col in df.columns:
-            df[col] = pd.to_datetime(df[col], errors='coerce')
+            raw = df[col]
+            parsed = pd.to_datetime(raw, format=DATE_FORMAT, errors='coerce')
+            
+            # Values in another layout (e.g. '15/06/2024 10:30') get a slower per-value retry
+            retry = parsed.isna() & raw.notna()
+            if retry.any():
+                parsed[retry] = pd.to_datetime(raw[retry], format='mixed', errors='coerce')
+                unparsed = (parsed.isna() & raw.notna()).sum()
+                if unparsed:
+                    print(f"   ⚠️ {unparsed:,} '{col}' values could not be parsed as dates (set to NaT)")
+            df[col] = parsed
     return df
 
 def apply_blacklist_logic(df):
@@ -155,26 +242,18 @@ def apply_blacklist_logic(df):
     - Pre-June 1st 2024: SAFE (Keep)
     - Post-June 1st 2024: CHECK Result (Keep if 1, Drop if 0)
     """
-    print("🔍 Applying Blacklist Logic...")
-    
-    # Ensure created_date is datetime
-    df['created_date'] = pd.to_datetime(df['created_date'], errors='coerce')
+    # created_date is already datetime (see clean_dates)
     
     df['blacklist_status'] = 0 # Default failure
     
-    # Logic iteration
-    # We need to map the raw values first
+    # Map the raw values first (vectorized, unmatched/missing -> NaN)
     # 1/Green -> Passed (1)
     # 0/Red -> Failed (0)
     
-    def parse_raw_blacklist(val):
-        if pd.isna(val): return None
-        s_val = str(val)
-        if 'green.png' in s_val or s_val == '1': return 1
-        if 'red.png' in s_val or s_val == '0': return 0
-        return None
-
-    df['blacklist_parsed'] = df['blacklist_raw'].apply(parse_raw_blacklist)
+    raw = df['blacklist_raw'].astype('string')
+    passed = (raw.str.contains('green.png', regex=False, na=False) | raw.isin(['1'])).to_numpy(dtype=bool)
+    failed = (raw.str.contains('red.png', regex=False, na=False) | raw.isin(['0'])).to_numpy(dtype=bool)
+    df['blacklist_parsed'] = np.select([passed, failed], [1, 0], default=np.nan)
     
     # Vectorized logic
     # Condition 1: Created BEFORE cutoff -> SAFE (1)
@@ -200,47 +279,44 @@ def process_identity(df):
     df['company_name'] = df['company_name'].fillna(df['company_account_fallback'])
     
     # Contact Name
-    df['contact_name'] = (df['first_name'].fillna('') + ' ' + df['last_name'].fillna('')).str.strip()
+    df['contact_name'] = (
+        df['first_name'].astype('string')
+        .str.cat(df['last_name'].astype('string'), sep=' ', na_rep='')
+        .str.strip()
+    )
     
     return df
 
 def process_digital_contact(df):
     # Email domain
     df['email'] = df['email'].str.lower().str.strip()
-    df['email_domain'] = df['email'].str.split('@').str[1]
+    df['email_domain'] = df['email'].str.extract(r'@([^@]+)$', expand=False)
     
     # Mobile
-    df['mobile'] = df['mobile'].astype(str).str.replace(r'[+\s-]', '', regex=True)
-    df['mobile'] = df['mobile'].replace(['nan', ''], np.nan)
+    mobile = df['mobile'].astype('string').str.replace(r'[+\s-]', '', regex=True)
+    df['mobile'] = mobile.mask(mobile.isin(['nan', '']))
     
     return df
 
 def process_business_tiers(df):
-    # Sales Tier 1-5
-    sales_map = {
-        'Nano Business (Less than $250 thousand)': 1,
-        'Micro Business ($250 thousand to $1 million)': 2,
-        'Small Business ($1 million to $5 million)': 3,
-        'Medium Business ($5 million to $50 million)': 4,
-        'Large Business ($50 million+)': 5
-    }
-    df['reported_annual_sales_tier'] = df['reported_annual_sales_tier'].map(sales_map).fillna(0).astype(int)
+    # Sales Tier 1-5 (list position + 1), unknown / missing -> 0
+    sales_tiers = [
+        'Nano Business (Less than $250 thousand)',
+        'Micro Business ($250 thousand to $1 million)',
+        'Small Business ($1 million to $5 million)',
+        'Medium Business ($5 million to $50 million)',
+        'Large Business ($50 million+)'
+    ]
+    codes = pd.Categorical(df['reported_annual_sales_tier'], categories=sales_tiers, ordered=True).codes
+    df['reported_annual_sales_tier'] = (codes + 1).astype('int8') # unmatched code -1 -> 0
     return df
 
-def main():
-    print(f"📂 Loading: {RAW_CSV_PATH}")
-    try:
-        df = pd.read_csv(RAW_CSV_PATH, encoding='utf-8-sig', low_memory=False)
-        print(f"   ✅ Queries Loaded: {len(df):,} records")
-    except FileNotFoundError:
-        print(f"   ❌ File not found: {RAW_CSV_PATH}")
-        return
+def process_batch(tbl):
+    """Clean and filter one raw Arrow batch; returns the kept rows with SELECTED_COLUMNS"""
+    # Blacklist rejects are dropped on the Arrow batch, before pandas conversion
+    df = arrow_to_pandas(prefilter_blacklist(tbl))
 
-    # 1. Rename columns based on mapping (Keep all for now)
-    # We invert the map to check if cols exist or use nice rename
-    # But some source cols map to specific targets.
-    
-    # Basic rename
+    # 1. Rename columns based on mapping
     df.rename(columns=COLUMN_MAPPING, inplace=True)
     
     # 2. Logic & Processing
@@ -251,42 +327,79 @@ def main():
     df = process_business_tiers(df)
     
     # 3. Filtering Rows
-    print("\n🔍 Filtering Rows based on Blacklist Logic...")
-    initial_count = len(df)
-    
     # Logic: Keep if blacklist_status == 1
     # (We already calculated blacklist_status to be 1 for pre-June and passed post-June)
-    df_filtered = df[df['blacklist_status'] == 1].copy()
+    # Rows and output columns are selected in one .loc call -> a single copy of only what is exported
+    keep = df['blacklist_status'].to_numpy() == 1
+    available_cols = [c for c in SELECTED_COLUMNS if c in df.columns]
+    df_final = df.loc[keep, available_cols].reset_index(drop=True)
     
-    dropped_count = initial_count - len(df_filtered)
+    # 4. Selecting Columns (missing ones filled with NaN)
+    if len(available_cols) < len(SELECTED_COLUMNS):
+        df_final = df_final.reindex(columns=SELECTED_COLUMNS)
+    
+    # Low-cardinality status fields as category (dictionary-encoded in Parquet)
+    for col in CATEGORY_COLUMNS:
+        df_final[col] = df_final[col].astype('category')
+    
+    return df_final
+
+def main():
+    print(f"📂 Loading: {RAW_CSV_PATH}")
+    try:
+        # Only mapped source columns are parsed; everything else is never materialized
+        reader = open_csv_arrow(RAW_CSV_PATH, columns=COLUMN_MAPPING)
+    except FileNotFoundError:
+        print(f"   ❌ File not found: {RAW_CSV_PATH}")
+        return
+
+    # Stream batch by batch: peak memory follows CSV_BLOCK_SIZE, not the raw file size
+    print("🔍 Applying Blacklist Logic (streaming batches)...")
+    os.makedirs(os.path.dirname(CLEANED_PARQUET_PATH), exist_ok=True)
+    loaded_count = 0
+    remaining_count = 0
+    writer = None
+    try:
+        for batch in reader:
+            loaded_count += batch.num_rows
+            df_final = process_batch(pa.Table.from_batches([batch]))
+            remaining_count += len(df_final)
+    
+            # 5. Export
+            # Parquet keeps dtypes (dates stay datetime64) so the enrich stage skips re-parsing
+            if writer is None:
+                writer = pq.ParquetWriter(CLEANED_PARQUET_PATH, output_schema(df_final), compression='snappy')
+            writer.write_table(pa.Table.from_pandas(df_final, schema=writer.schema, preserve_index=False))
+    finally:
+        if writer is not None:
+            writer.close()
+    
+    if writer is None:
+        # No data rows at all: still hand an (empty) file to the enrich stage
+        pd.DataFrame(columns=SELECTED_COLUMNS).to_parquet(CLEANED_PARQUET_PATH, engine='pyarrow', index=False)
+    print(f"   ✅ Queries Loaded: {loaded_count:,} records")
+    
+    print("\n🔍 Filtering Rows based on Blacklist Logic...")
+    dropped_count = loaded_count - remaining_count
     print(f"   ❌ Dropped {dropped_count:,} leads (Failed Post-June Blacklist checks)")
-    print(f"   ✅ Remaining {len(df_filtered):,} leads")
+    print(f"   ✅ Remaining {remaining_count:,} leads")
     
-    # 4. Selecting Columns
     print("\nTarget Columns Selection...")
     
     # Check what's missing
-    available_cols = df_filtered.columns.tolist()
-    missing_cols = [c for c in SELECTED_COLUMNS if c not in available_cols]
+    source_cols = {COLUMN_MAPPING[c] for c in reader.schema.names}
+    missing_cols = [c for c in SELECTED_COLUMNS if c not in source_cols]
     
     if missing_cols:
-        print(f"   ⚠️ Warning: {len(missing_cols)} columns missing from source, filling with NaN:")
+        print(f"   ⚠️ Warning: {len(missing_cols)} columns missing from source, filled with NaN:")
         for c in missing_cols:
             print(f"      - {c}")
-            df_filtered[c] = np.nan
-            
-    # Select only the requested subset
-    df_final = df_filtered[SELECTED_COLUMNS]
-    
-    # 5. Export
-    os.makedirs(os.path.dirname(CLEANED_CSV_PATH), exist_ok=True)
-    df_final.to_csv(CLEANED_CSV_PATH, index=False, encoding='utf-8-sig')
     
     print("\n" + "="*70)
     print("✅ PIPELINE COMPLETE")
     print("="*70)
-    print(f"Output: {CLEANED_CSV_PATH}")
-    print(f"Shape: {df_final.shape}")
+    print(f"Output: {CLEANED_PARQUET_PATH}")
+    print(f"Shape: ({remaining_count}, {len(SELECTED_COLUMNS)})")
 
 if __name__ == "__main__":
     main()